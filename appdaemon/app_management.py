@@ -1,22 +1,25 @@
 import asyncio
+import concurrent.futures
 import copy
-import cProfile
+import datetime
+import errno
+import hashlib
+import heapq
 import importlib
-import io
 import logging
 import os
-import pstats
 import subprocess
 import sys
-import traceback
+import threading
 import uuid
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from enum import Enum
 from logging import Logger
+from operator import itemgetter
 from pathlib import Path
 from types import ModuleType
-from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Literal, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, List, Literal, Optional, Set, Tuple, Union
 
 import appdaemon.utils as utils
 
@@ -86,6 +89,27 @@ class AppActions:
         self.term[appname] = 1
 
 
+@dataclass
+class AppDirScan:
+    """Stores the results of a single pass over the apps directory, which is made by :meth:`AppManagement.scan_app_dir`
+
+    Attributes:
+        dirs: Directories that were walked, in the order they were found
+        files: Modified times of the files that were found, keyed by file extension and then by path
+        unreadable: Python files that were found but can't be read, only checked for the ``normal`` import method
+    """
+
+    dirs: List[str] = field(default_factory=list)
+    files: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    unreadable: Set[str] = field(default_factory=set)
+
+
+# Values of these types have a repr that's unique to both the type and the value
+_DIGEST_SCALAR_TYPES = frozenset(
+    {str, int, float, bool, type(None), bytes, datetime.date, datetime.datetime, datetime.time}
+)
+
+
 class AppManagement:
     """Subsystem container for managing app lifecycles"""
 
@@ -108,6 +132,10 @@ class AppManagement:
     filter_files: Dict[str, float]
     """Dictionary of the modified times of the filter files and their paths.
     """
+    config_file_cache: Dict[str, Tuple[float, Dict[str, Dict], Dict[str, Optional[bytes]], Dict[str, float]]]
+    """Dictionary of the parsed app config files, along with the modified time they were parsed at, the digest of
+    each entry, and the modified times of the other files they pulled in, keyed by path
+    """
     modules: Dict[str, ModuleType]
     """Dictionary of the loaded modules and their names
     """
@@ -117,10 +145,34 @@ class AppManagement:
     - ``self.init_object``, which instantiates the app classes
     - ``self.init_plugin_object``
     - ``self.init_sequence_object``
+
+    Entries are never added or removed in place. Instead the dictionary is copied and swapped under
+    ``self.objects_lock``, so it can be read and iterated from other threads without locking.
     """
     app_config: Dict[str, Dict[str, Dict[str, bool]]]
     """Keeps track of which module and class each app comes from, along with any associated global modules. Gets set at the end of :meth:`~appdaemon.app_management.AppManagement.check_config`.
     """
+    _apps_by_module: Dict[str, List[str]]
+    """Names of the apps that come from each top-level module, in config order. Rebuilt from ``app_config`` by :meth:`~appdaemon.app_management.AppManagement._index_app_config`.
+    """
+    _apps_by_global_module: Dict[str, List[str]]
+    """Names of the apps that list each module in ``global_dependencies`` or ``dependencies``, in config order"""
+    _norm_deps: Dict[str, Tuple[str, ...]]
+    """The ``dependencies`` of each app, normalized to a tuple"""
+    _norm_gdeps: Dict[str, Tuple[str, ...]]
+    """The ``global_dependencies`` of each app, normalized to a tuple"""
+    _deps_frozen: Dict[str, FrozenSet[str]]
+    """Dependencies of each app that are themselves in ``app_config``, as passed to :meth:`~appdaemon.app_management.AppManagement.topological_sort`"""
+    _missing_deps: Dict[str, Tuple[str, ...]]
+    """Dependencies of each app that can't be found in ``app_config``"""
+    _dependency_order: Optional[List[str]]
+    """Every app in ``app_config`` that :meth:`~appdaemon.app_management.AppManagement.topological_sort` could order, cached until the dependencies change"""
+    _dependents: Dict[str, List[str]]
+    """Names of the apps that depend on each app or global module, directly, in config order. Only has entries with at least one app."""
+    _global_modules: Set[str]
+    """Same modules as :meth:`~appdaemon.app_management.AppManagement.get_global_modules`, as a set for membership tests"""
+    _app_plugins: Dict[str, Set[str]]
+    """Plugins each app depends on, for the apps that set ``plugin`` in their config"""
     active_apps: List[str]
     inactive_apps: List[str]
     non_apps: List[str]
@@ -136,18 +188,39 @@ class AppManagement:
         self.filter_files = {}
         self.modules = {}
         self.objects = {}
+        self.objects_lock = threading.Lock()
         self.check_app_updates_profile_stats = None
         self.check_updates_lock = None
 
+        # Separate from the main executor, because the scan itself already runs in there
+        self.scan_executor = None
+        if self.AD.app_dir_scan_workers > 0:
+            self.scan_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.AD.app_dir_scan_workers, thread_name_prefix="app_dir_scan"
+            )
+
         # Initialize config file tracking
 
         self.app_config_file_modified = 0
         self.app_config_files = {}
+        self.config_file_cache = {}
+        self._app_config_digests: Dict[str, Optional[bytes]] = {}
+        self._read_config_digests: Dict[str, Optional[bytes]] = {}
         self.module_dirs = []
 
         # Keeps track of the name of the module and class to load for each app name
         self.app_config = {}
         self.global_module_dependencies = {}
+        self._apps_by_module = {}
+        self._apps_by_global_module = {}
+        self._norm_deps = {}
+        self._norm_gdeps = {}
+        self._deps_frozen = {}
+        self._missing_deps = {}
+        self._dependency_order = None
+        self._dependents = {}
+        self._global_modules = set()
+        self._app_plugins = {}
 
         self.apps_initialized = False
 
@@ -221,25 +294,44 @@ class AppManagement:
         if self.apps_initialized is True:
             await self.check_app_updates(mode=UpdateMode.TERMINATE)
 
+        if self.scan_executor is not None:
+            self.scan_executor.shutdown(wait=False)
+
     async def dump_objects(self):
         self.diag.info("--------------------------------------------------")
         self.diag.info("Objects")
         self.diag.info("--------------------------------------------------")
-        for object_ in self.objects.keys():
-            self.diag.info("%s: %s", object_, self.objects[object_])
+        for object_, entry in self.objects.items():
+            self.diag.info("%s: %s", object_, entry)
         self.diag.info("--------------------------------------------------")
 
     async def get_app(self, name: str):
-        if name in self.objects:
-            return self.objects[name]["object"]
+        entry = self.objects.get(name)
+        if entry is not None:
+            return entry["object"]
 
     def get_app_info(self, name: str):
-        if name in self.objects:
-            return self.objects[name]
+        return self.objects.get(name)
 
     async def get_app_instance(self, name: str, id):
-        if name in self.objects and self.objects[name]["id"] == id:
-            return self.AD.app_management.objects[name]["object"]
+        entry = self.objects.get(name)
+        if entry is not None and entry["id"] == id:
+            return entry["object"]
+
+    def _set_object(self, name: str, entry: Dict[str, Any]):
+        """Adds or replaces an entry in ``self.objects`` by swapping in an updated copy"""
+        with self.objects_lock:
+            objects = dict(self.objects)
+            objects[name] = entry
+            self.objects = objects
+
+    def _remove_object(self, name: str):
+        """Removes an entry from ``self.objects``, if it's there, by swapping in an updated copy"""
+        with self.objects_lock:
+            if name in self.objects:
+                objects = dict(self.objects)
+                del objects[name]
+                self.objects = objects
 
     async def initialize_app(self, name: str):
         if name in self.objects:
@@ -275,9 +367,7 @@ class AppManagement:
         except Exception:
             error_logger = logging.getLogger("Error.{}".format(name))
             error_logger.warning("-" * 60)
-            error_logger.warning("Unexpected error running initialize() for %s", name)
-            error_logger.warning("-" * 60)
-            error_logger.warning(traceback.format_exc())
+            error_logger.warning("Unexpected error running initialize() for %s", name, exc_info=True)
             error_logger.warning("-" * 60)
             if self.AD.logging.separate_error_log() is True:
                 self.logger.warning("Logged an error to %s", self.AD.logging.get_filename("error_log"))
@@ -308,9 +398,7 @@ class AppManagement:
             except BaseException:
                 error_logger = logging.getLogger("Error.{}".format(name))
                 error_logger.warning("-" * 60)
-                error_logger.warning("Unexpected error running terminate() for %s", name)
-                error_logger.warning("-" * 60)
-                error_logger.warning(traceback.format_exc())
+                error_logger.warning("Unexpected error running terminate() for %s", name, exc_info=True)
                 error_logger.warning("-" * 60)
                 if self.AD.logging.separate_error_log() is True:
                     self.logger.warning(
@@ -321,8 +409,7 @@ class AppManagement:
                 executed = False
 
         if delete:
-            if name in self.objects:
-                del self.objects[name]
+            self._remove_object(name)
 
             # if name in self.global_module_dependencies:
             #    del self.global_module_dependencies[name]
@@ -377,9 +464,7 @@ class AppManagement:
         except Exception:
             error_logger = logging.getLogger("Error.{}".format(app))
             error_logger.warning("-" * 60)
-            error_logger.warning("Unexpected error terminating app: %s:", app)
-            error_logger.warning("-" * 60)
-            error_logger.warning(traceback.format_exc())
+            error_logger.warning("Unexpected error terminating app: %s:", app, exc_info=True)
             error_logger.warning("-" * 60)
             if self.AD.logging.separate_error_log() is True:
                 self.logger.warning("Logged an error to %s", self.AD.logging.get_filename("error_log"))
@@ -391,8 +476,9 @@ class AppManagement:
         await self.start_app(app)
 
     def get_app_debug_level(self, app):
-        if app in self.objects:
-            return self.AD.logging.get_level_from_int(self.objects[app]["object"].logger.getEffectiveLevel())
+        entry = self.objects.get(app)
+        if entry is not None:
+            return self.AD.logging.get_level_from_int(entry["object"].logger.getEffectiveLevel())
         else:
             return "None"
 
@@ -447,22 +533,25 @@ class AppManagement:
                 await self.increase_inactive_apps(app_name)
 
             else:
-                self.objects[app_name] = {
-                    "type": "app",
-                    "object": app_class(
-                        self.AD,
-                        app_name,
-                        self.AD.logging,
-                        app_args,
-                        self.AD.config,
-                        self.app_config,
-                        self.AD.global_vars,
-                    ),
-                    "id": uuid.uuid4().hex,
-                    "pin_app": self.AD.threading.app_should_be_pinned(app_name),
-                    "pin_thread": pin,
-                    "running": True,
-                }
+                self._set_object(
+                    app_name,
+                    {
+                        "type": "app",
+                        "object": app_class(
+                            self.AD,
+                            app_name,
+                            self.AD.logging,
+                            app_args,
+                            self.AD.config,
+                            self.app_config,
+                            self.AD.global_vars,
+                        ),
+                        "id": uuid.uuid4().hex,
+                        "pin_app": self.AD.threading.app_should_be_pinned(app_name),
+                        "pin_thread": pin,
+                        "running": True,
+                    },
+                )
 
                 # load the module path into app entity
                 module_path = await utils.run_in_executor(self, os.path.abspath, mod_obj.__file__)
@@ -477,150 +566,151 @@ class AppManagement:
             await self.increase_inactive_apps(app_name)
 
     def init_plugin_object(self, name: str, object: object, use_dictionary_unpacking: bool = False) -> None:
-        self.objects[name] = {
-            "type": "plugin",
-            "object": object,
-            "id": uuid.uuid4().hex,
-            "pin_app": False,
-            "pin_thread": -1,
-            "running": False,
-            "use_dictionary_unpacking": use_dictionary_unpacking,
-        }
+        self._set_object(
+            name,
+            {
+                "type": "plugin",
+                "object": object,
+                "id": uuid.uuid4().hex,
+                "pin_app": False,
+                "pin_thread": -1,
+                "running": False,
+                "use_dictionary_unpacking": use_dictionary_unpacking,
+            },
+        )
 
     def init_sequence_object(self, name, object):
         """Initialize the sequence"""
 
-        self.objects[name] = {
-            "type": "sequence",
-            "object": object,
-            "id": uuid.uuid4().hex,
-            "pin_app": False,
-            "pin_thread": -1,
-            "running": False,
-        }
+        self._set_object(
+            name,
+            {
+                "type": "sequence",
+                "object": object,
+                "id": uuid.uuid4().hex,
+                "pin_app": False,
+                "pin_thread": -1,
+                "running": False,
+            },
+        )
 
     async def terminate_sequence(self, name: str) -> bool:
         """Terminate the sequence"""
 
-        if name in self.objects:
-            del self.objects[name]
+        self._remove_object(name)
 
         await self.AD.callbacks.clear_callbacks(name)
         self.AD.futures.cancel_futures(name)
 
         return True
 
-    async def read_config(self) -> Dict[str, Dict[str, Any]]:  # noqa: C901
-        """Walks the apps directory and reads all the config files with :func:`~.utils.read_config_file`, which reads individual config files and runs in the :attr:`~.appdaemon.AppDaemon.executor`.
+    async def read_config(self, scan: AppDirScan) -> Dict[str, Dict[str, Any]]:  # noqa: C901
+        """Reads all the config files found in the apps directory with :func:`~.utils.read_config_file`, which reads individual config files and runs in the :attr:`~.appdaemon.AppDaemon.executor`.
+
+        Args:
+            scan (AppDirScan): Contents of the apps directory, from :meth:`~AppManagement.scan_app_dir`
+
+        The digest of each app's config is left in ``self._read_config_digests``, for :meth:`~AppManagement.check_config`
+        to compare against.
 
         Returns:
-            Dict[str, Dict[str, Any]]: Loaded app configuration
+            Dict[str, Dict[str, Any]]: Loaded app configuration, which is empty if there are no config files
         """
-        new_config = None
-
-        for root, subdirs, files in await utils.run_in_executor(self, os.walk, self.AD.app_dir):
-            subdirs[:] = [d for d in subdirs if d not in self.AD.exclude_dirs and "." not in d]
-            if root[-11:] != "__pycache__" and root[0] != ".":
-                for file in files:
-                    if file[-5:] == self.ext and file[0] != ".":
-                        path = os.path.join(root, file)
-                        self.logger.debug("Reading %s", path)
-                        config: Dict[str, Dict] = await utils.run_in_executor(self, self.read_config_file, path)
-                        valid_apps = {}
-                        if type(config).__name__ == "dict":
-                            for app in config:
-                                if config[app] is not None:
-                                    app_valid = True
-                                    if app == "global_modules":
-                                        self.logger.warning(
-                                            "global_modules directive has been deprecated and will be removed"
-                                            " in a future release"
-                                        )
-                                        #
-                                        # Check the parameter format for string or list
-                                        #
-                                        if isinstance(config[app], str):
-                                            valid_apps[app] = [config[app]]
-                                        elif isinstance(config[app], list):
-                                            valid_apps[app] = config[app]
-                                        else:
-                                            if self.AD.invalid_config_warnings:
-                                                self.logger.warning(
-                                                    (
-                                                        "global_modules should be a list or a string in File"
-                                                        " '%s' - ignoring"
-                                                    ),
-                                                    file,
-                                                )
-                                    elif app == "sequence":
-                                        #
-                                        # We don't care what it looks like just pass it through
-                                        #
-                                        valid_apps[app] = config[app]
-                                    elif "." in app:
-                                        #
-                                        # We ignore any app containing a dot.
-                                        #
-                                        pass
-                                    elif (
-                                        isinstance(config[app], dict)
-                                        and "class" in config[app]
-                                        and "module" in config[app]
-                                    ):
-                                        valid_apps[app] = config[app]
-                                        valid_apps[app]["config_path"] = path
-                                    elif (
-                                        isinstance(config[app], dict)
-                                        and "module" in config[app]
-                                        and "global" in config[app]
-                                        and config[app]["global"] is True
-                                    ):
-                                        valid_apps[app] = config[app]
-                                        valid_apps[app]["config_path"] = path
-                                    else:
-                                        app_valid = False
-                                        if self.AD.invalid_config_warnings:
-                                            self.logger.warning(
-                                                "App '%s' missing 'class' or 'module' entry - ignoring",
-                                                app,
-                                            )
-
-                                    if app_valid is True:
-                                        # now add app to the path
-                                        if path not in self.app_config_files:
-                                            self.app_config_files[path] = []
-
-                                        self.app_config_files[path].append(app)
+        new_config = {}
+        new_digests = {}
+
+        for path, modified in scan.files.get(self.ext, {}).items():
+            self.logger.debug("Reading %s", path)
+            config, digests = await utils.run_in_executor(self, self.read_config_file_cached, path, modified)
+            valid_apps = {}
+            if isinstance(config, dict):
+                for app in config:
+                    if config[app] is not None:
+                        app_valid = True
+                        if app == "global_modules":
+                            self.logger.warning(
+                                "global_modules directive has been deprecated and will be removed"
+                                " in a future release"
+                            )
+                            #
+                            # Check the parameter format for string or list
+                            #
+                            if isinstance(config[app], str):
+                                valid_apps[app] = [config[app]]
+                            elif isinstance(config[app], list):
+                                valid_apps[app] = config[app]
+                            else:
+                                if self.AD.invalid_config_warnings:
+                                    self.logger.warning(
+                                        "global_modules should be a list or a string in File '%s' - ignoring",
+                                        path,
+                                    )
+                        elif app == "sequence":
+                            #
+                            # We don't care what it looks like just pass it through
+                            #
+                            valid_apps[app] = config[app]
+                        elif "." in app:
+                            #
+                            # We ignore any app containing a dot.
+                            #
+                            pass
+                        elif isinstance(config[app], dict) and "class" in config[app] and "module" in config[app]:
+                            valid_apps[app] = config[app]
+                            valid_apps[app]["config_path"] = path
+                        elif (
+                            isinstance(config[app], dict)
+                            and "module" in config[app]
+                            and "global" in config[app]
+                            and config[app]["global"] is True
+                        ):
+                            valid_apps[app] = config[app]
+                            valid_apps[app]["config_path"] = path
                         else:
+                            app_valid = False
                             if self.AD.invalid_config_warnings:
                                 self.logger.warning(
-                                    "File '%s' invalid structure - ignoring",
-                                    os.path.join(root, file),
-                                )
-
-                        if new_config is None:
-                            new_config = {}
-                        for app in valid_apps:
-                            if app == "global_modules":
-                                if app in new_config:
-                                    new_config[app].extend(valid_apps[app])
-                                    continue
-                            if app == "sequence":
-                                if app in new_config:
-                                    new_config[app] = {
-                                        **new_config[app],
-                                        **valid_apps[app],
-                                    }
-                                    continue
-
-                            if app in new_config:
-                                self.logger.warning(
-                                    "File '%s' duplicate app: %s - ignoring",
-                                    os.path.join(root, file),
+                                    "App '%s' missing 'class' or 'module' entry - ignoring",
                                     app,
                                 )
-                            else:
-                                new_config[app] = valid_apps[app]
+
+                        if app_valid is True:
+                            # now add app to the path
+                            if path not in self.app_config_files:
+                                self.app_config_files[path] = []
+
+                            self.app_config_files[path].append(app)
+            else:
+                if self.AD.invalid_config_warnings:
+                    self.logger.warning(
+                        "File '%s' invalid structure - ignoring",
+                        path,
+                    )
+
+            for app in valid_apps:
+                if app == "global_modules":
+                    if app in new_config:
+                        new_config[app].extend(valid_apps[app])
+                        continue
+                if app == "sequence":
+                    if app in new_config:
+                        new_config[app] = {
+                            **new_config[app],
+                            **valid_apps[app],
+                        }
+                        continue
+
+                if app in new_config:
+                    self.logger.warning(
+                        "File '%s' duplicate app: %s - ignoring",
+                        path,
+                        app,
+                    )
+                else:
+                    new_config[app] = valid_apps[app]
+                    new_digests[app] = digests.get(app)
+
+        self._read_config_digests = new_digests
 
         await self.check_sequence_update(new_config.get("sequence", {}))
 
@@ -655,24 +745,17 @@ class AppManagement:
                 await self.AD.sequences.add_sequences(modified_sequences)
 
     # Run in executor
-    def check_later_app_configs(self, last_latest):
+    def check_later_app_configs(self, last_latest, scan: AppDirScan):
         later_files = {}
-        app_config_files = []
+        app_config_files = scan.files.get(self.ext, {})
         later_files["files"] = []
         later_files["latest"] = last_latest
         later_files["deleted"] = []
-        for root, subdirs, files in os.walk(self.AD.app_dir):
-            subdirs[:] = [d for d in subdirs if d not in self.AD.exclude_dirs and "." not in d]
-            if root[-11:] != "__pycache__" and root[0] != ".":
-                for file in files:
-                    if file[-5:] == self.ext and file[0] != ".":
-                        path = os.path.join(root, file)
-                        app_config_files.append(path)
-                        ts = os.path.getmtime(path)
-                        if ts > last_latest:
-                            later_files["files"].append(path)
-                        if ts > later_files["latest"]:
-                            later_files["latest"] = ts
+        for path, ts in app_config_files.items():
+            if ts > last_latest:
+                later_files["files"].append(path)
+            if ts > later_files["latest"]:
+                later_files["latest"] = ts
 
         for file in self.app_config_files:
             if file not in app_config_files:
@@ -692,24 +775,102 @@ class AppManagement:
         return later_files
 
     # Run in executor
-    def read_config_file(self, file) -> Dict[str, Dict]:
-        """Reads a single YAML or TOML file."""
+    def read_config_file(self, file, included: Optional[List[Tuple[str, float]]] = None) -> Dict[str, Dict]:
+        """Reads a single YAML or TOML file, see :func:`~.utils.read_config_file`."""
         try:
-            return utils.read_config_file(file)
+            return utils.read_config_file(file, included)
         except Exception:
             self.logger.warning("-" * 60)
-            self.logger.warning("Unexpected error loading config file: %s", file)
-            self.logger.warning("-" * 60)
-            self.logger.warning(traceback.format_exc())
+            self.logger.warning("Unexpected error loading config file: %s", file, exc_info=True)
             self.logger.warning("-" * 60)
 
+    # Run in executor
+    def read_config_file_cached(
+        self, file, modified: float
+    ) -> Tuple[Optional[Dict[str, Dict]], Dict[str, Optional[bytes]]]:
+        """Reads a single YAML or TOML file, reusing the previous result if neither the file nor any of the files it
+        pulled in with ``!include`` or its own ``secrets`` file have been modified since.
+
+        A copy of the config is returned every time, as :meth:`~AppManagement.read_config` modifies the config it gets
+        back.
+
+        Returns:
+            Tuple of the config and the digest of each of its top level entries, see
+            :meth:`~AppManagement.config_digest`
+        """
+        cached = self.config_file_cache.get(file)
+        if cached is None or cached[0] != modified or not self._included_files_unchanged(cached[3]):
+            included = []
+            config = self.read_config_file(file, included)
+            if config is None:
+                self.config_file_cache.pop(file, None)
+                return None, {}
+            digests = {}
+            if isinstance(config, dict):
+                digests = {name: self.config_digest(cfg) for name, cfg in config.items()}
+            cached = self.config_file_cache[file] = (modified, config, digests, dict(included))
+
+        return copy.deepcopy(cached[1]), cached[2]
+
+    @staticmethod
+    def _included_files_unchanged(included: Dict[str, float]) -> bool:
+        for path, modified in included.items():
+            try:
+                if os.path.getmtime(path) != modified:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @classmethod
+    def config_digest(cls, cfg: Any) -> Optional[bytes]:
+        """Gets a digest of a config entry.
+
+        This is only calculated when a file is parsed, and comparing digests is much cheaper than comparing the
+        entries themselves on every config check. The entry is serialized with the type of every value, so entries
+        that only differ in type, like ``1`` and ``"1"``, get different digests.
+
+        Returns:
+            Digest of the entry, or None if it contains a type that can't be serialized faithfully, in which case the
+            entry has to be compared in full
+        """
+        try:
+            serialized = repr(cls._digest_canonical(cfg))
+        except TypeError:
+            return None
+        return hashlib.blake2b(serialized.encode(), digest_size=16).digest()
+
+    @classmethod
+    def _digest_canonical(cls, value: Any) -> Any:
+        """Converts a config value into nested tuples that have the same ``repr`` only if the values are equal and
+        of the same types.
+
+        Raises:
+            TypeError: if the value contains anything other than the plain types the config parsers produce
+        """
+        value_type = type(value)
+        if value_type is dict:
+            items = ((cls._digest_canonical(k), cls._digest_canonical(v)) for k, v in value.items())
+            return ("dict", tuple(sorted(items, key=repr)))
+        elif value_type is list or value_type is tuple:
+            return (value_type.__name__, tuple(cls._digest_canonical(v) for v in value))
+        elif value_type is set or value_type is frozenset:
+            return ("set", tuple(sorted((cls._digest_canonical(v) for v in value), key=repr)))
+        elif value_type in _DIGEST_SCALAR_TYPES:
+            return value
+        raise TypeError(f"Can't make a digest of {value_type.__name__}")
+
     # noinspection PyBroadException
-    async def check_config(self, silent: bool = False, add_threads: bool = True) -> Optional[AppActions]:  # noqa: C901
+    async def check_config(
+        self, silent: bool = False, add_threads: bool = True, scan: Optional[AppDirScan] = None
+    ) -> Optional[AppActions]:  # noqa: C901
         """Wraps :meth:`~AppManagement.read_config`
 
         Args:
             silent (bool, optional): _description_. Defaults to False.
             add_threads (bool, optional): _description_. Defaults to True.
+            scan (AppDirScan, optional): Contents of the apps directory, if it has already been scanned during this
+                check. Defaults to None, which scans it again.
 
         Returns:
             AppActions object with information about which apps to initialize and/or terminate
@@ -719,17 +880,28 @@ class AppManagement:
         total_apps = len(self.app_config)
 
         try:
-            latest = await utils.run_in_executor(self, self.check_later_app_configs, self.app_config_file_modified)
+            if scan is None:
+                scan = await utils.run_in_executor(self, self.scan_app_dir)
+
+            latest = await utils.run_in_executor(
+                self, self.check_later_app_configs, self.app_config_file_modified, scan
+            )
             self.app_config_file_modified = latest["latest"]
 
+            for file in latest["deleted"]:
+                self.config_file_cache.pop(file, None)
+
+            # Secrets are substituted while parsing, so every cached file could be stale
+            secrets_file = f"secrets{self.ext}"
+            if any(os.path.basename(file) == secrets_file for file in latest["files"] + latest["deleted"]):
+                self.config_file_cache.clear()
+
             if latest["files"] or latest["deleted"]:
                 if silent is False:
                     self.logger.info("Reading config")
-                new_config = await self.read_config()
-                if new_config is None:
-                    if silent is False:
-                        self.logger.warning("New config not applied")
-                    return
+                # If every config file has been deleted this is an empty config, so all the apps get terminated
+                new_config = await self.read_config(scan)
+                new_digests = self._read_config_digests
 
                 for file in latest["deleted"]:
                     if silent is False:
@@ -741,7 +913,7 @@ class AppManagement:
 
                 # Check for changes
 
-                for name in self.app_config:
+                for name, app_cfg in self.app_config.items():
                     if name in self.non_apps:
                         continue
 
@@ -749,7 +921,11 @@ class AppManagement:
                         # first we need to remove thhe config path if it exists
                         config_path = new_config[name].pop("config_path", None)
 
-                        if self.app_config[name] != new_config[name]:
+                        digest = new_digests.get(name)
+                        if digest is not None and digest == self._app_config_digests.get(name):
+                            # Same digest as last time, so the config can't have changed
+                            pass
+                        elif app_cfg != new_config[name]:
                             # Something changed, clear and reload
 
                             if silent is False:
@@ -774,7 +950,7 @@ class AppManagement:
                         await self.terminate_app(name, delete=True)
                         await self.remove_entity(name)
 
-                for name in new_config:
+                for name, app_cfg in new_config.items():
                     if name in self.non_apps:
                         continue
 
@@ -783,11 +959,9 @@ class AppManagement:
                         # New section added!
                         #
 
-                        if "class" in new_config[name] and "module" in new_config[name]:
+                        if "class" in app_cfg and "module" in app_cfg:
                             # first we need to remove thhe config path if it exists
-                            config_path = await utils.run_in_executor(
-                                self, os.path.abspath, new_config[name].pop("config_path")
-                            )
+                            config_path = await utils.run_in_executor(self, os.path.abspath, app_cfg.pop("config_path"))
 
                             self.logger.info("App '%s' added", name)
                             initialize_apps[name] = 1
@@ -797,7 +971,7 @@ class AppManagement:
                                 {
                                     "totalcallbacks": 0,
                                     "instancecallbacks": 0,
-                                    "args": new_config[name],
+                                    "args": app_cfg,
                                     "config_path": config_path,
                                 },
                             )
@@ -812,6 +986,8 @@ class AppManagement:
                                     )
 
                 self.app_config = new_config
+                self._app_config_digests = new_digests
+                self._index_app_config()
                 total_apps = len(self.app_config)
 
                 for name in self.non_apps:
@@ -843,33 +1019,79 @@ class AppManagement:
             return AppActions(init=initialize_apps, term=terminate_apps, total=total_apps, active=active_apps)
         except Exception:
             self.logger.warning("-" * 60)
-            self.logger.warning("Unexpected error:")
-            self.logger.warning("-" * 60)
-            self.logger.warning(traceback.format_exc())
+            self.logger.warning("Unexpected error:", exc_info=True)
             self.logger.warning("-" * 60)
 
+    def _index_app_config(self):
+        """Rebuilds the lookups derived from ``self.app_config``, which needs to happen every time it's replaced"""
+        self._apps_by_module = {}
+        self._apps_by_global_module = {}
+        self._app_plugins = {}
+        self._norm_deps = {}
+        self._norm_gdeps = {}
+        self._deps_frozen = {}
+        self._missing_deps = {}
+        self._dependency_order = None
+        self._dependents = {}
+        for app_name, app_cfg in self.app_config.items():
+            if app_name in self.non_apps:
+                continue
+            self._apps_by_module.setdefault(app_cfg["module"].split(".")[0], []).append(app_name)
+            if "plugin" in app_cfg:
+                self._app_plugins[app_name] = set(utils.single_or_list(app_cfg["plugin"]))
+
+            if "global_dependencies" in app_cfg:
+                self._norm_gdeps[app_name] = tuple(utils.single_or_list(app_cfg["global_dependencies"]))
+            if "dependencies" in app_cfg:
+                self._norm_deps[app_name] = tuple(utils.single_or_list(app_cfg["dependencies"]))
+            for gm in self._norm_gdeps.get(app_name, ()) + self._norm_deps.get(app_name, ()):
+                self._apps_by_global_module.setdefault(gm, []).append(app_name)
+
+            self._index_app_dependencies(app_name)
+        self._global_modules = set(self.get_global_modules())
+
+    def _index_app_dependencies(self, app_name: str):
+        """Updates the dependency lookups for a single app, after its config or registered dependencies change.
+
+        Repeated dependencies are only counted once, and an app depending on itself is ignored with a warning.
+        """
+        app_deps = dict.fromkeys(self.get_app_dependencies(app_name))
+        if app_name in app_deps:
+            self.logger.warning("App %s depends on itself - ignoring that dependency", app_name)
+            del app_deps[app_name]
+        self._deps_frozen[app_name] = frozenset(dep for dep in app_deps if dep in self.app_config)
+        missing = tuple(dep for dep in app_deps if dep not in self.app_config)
+        if missing:
+            self._missing_deps[app_name] = missing
+        else:
+            self._missing_deps.pop(app_name, None)
+        self._dependency_order = None
+
+        for dep in app_deps:
+            dependents = self._dependents.setdefault(dep, [])
+            if app_name not in dependents:
+                dependents.append(app_name)
+
     def get_active_app_count(self):
         active = 0
         inactive = 0
         glbl = 0
-        for name in self.app_config:
-            if "disable" in self.app_config[name] and self.app_config[name]["disable"] is True:
+        non_apps = self.non_apps
+        for name, app_cfg in self.app_config.items():
+            if name in non_apps:
+                pass
+            elif app_cfg.get("disable") is True:
                 inactive += 1
-            elif "global" in self.app_config[name] and self.app_config[name]["global"] is True:
+            elif app_cfg.get("global") is True:
                 glbl += 1
-            elif name in self.non_apps:
-                pass
             else:
                 active += 1
         return active, inactive, glbl
 
     def get_app_from_file(self, file):
         """Finds the apps that depend on a given file"""
-        module_name = self.get_module_from_path(file)
-        for app_name, cfg in self.app_config.items():
-            if "module" in cfg and cfg["module"].startswith(module_name):
-                return app_name
-        return None
+        app_names = self._apps_by_module.get(self.get_module_from_path(file))
+        return app_names[0] if app_names else None
 
     # noinspection PyBroadException
     # Run in executor
@@ -915,8 +1137,10 @@ class AppManagement:
                     self.logger.warning("No app description found for: %s - ignoring", module_name)
 
     @staticmethod
-    def get_module_from_path(path):
-        return Path(path).stem
+    def get_module_from_path(path: Union[str, Path]) -> str:
+        """Gets the module name from the path of a file."""
+        name = os.path.basename(path)
+        return name[:-3] if name.endswith(".py") and len(name) > 3 else os.path.splitext(name)[0]
 
     def get_file_from_module(self, module_name: str) -> Optional[Path]:
         """Gets the module __file__ based on the module name.
@@ -935,7 +1159,8 @@ class AppManagement:
             return None
         else:
             module_path = Path(module_obj.__file__)
-            if self.monitored_files and all(isinstance(f, Path) for f in self.monitored_files):
+            # Files are only monitored as Paths when using the expert import method
+            if self.AD.import_method == "expert" and self.monitored_files:
                 assert module_path in self.monitored_files, f"{module_path} is not being monitored"
             return module_path
 
@@ -948,24 +1173,17 @@ class AppManagement:
         return self.get_file_from_module(module_name)
 
     # Run in executor
-    def process_filters(self):
+    def process_filters(self, scan: AppDirScan):
         if "filters" in self.AD.config:
-            for filter in self.AD.config["filters"]:
-                for root, subdirs, files in os.walk(self.AD.app_dir, topdown=True):
-                    # print(root, subdirs, files)
-                    #
-                    # Prune dir list
-                    #
-                    subdirs[:] = [d for d in subdirs if d not in self.AD.exclude_dirs and "." not in d]
-
-                    ext = filter["input_ext"]
-                    extlen = len(ext) * -1
-
-                    for file in files:
+            # An empty input_ext never matched anything, so leave those out rather than matching every file
+            filters = [(filter["input_ext"], filter) for filter in self.AD.config["filters"] if filter["input_ext"]]
+
+            # Each file is checked against all the filters in one pass over the scan
+            for files in scan.files.values():
+                for infile, modified in files.items():
+                    for ext, filter in filters:
                         run = False
-                        if file[extlen:] == ext:
-                            infile = os.path.join(root, file)
-                            modified = os.path.getmtime(infile)
+                        if infile.endswith(ext):
                             if infile in self.filter_files:
                                 if self.filter_files[infile] < modified:
                                     run = True
@@ -986,15 +1204,81 @@ class AppManagement:
                                     subprocess.Popen(command_line, shell=True)
                                 except Exception:
                                     self.logger.warning("-" * 60)
-                                    self.logger.warning("Unexpected running filter on: %s:", infile)
-                                    self.logger.warning("-" * 60)
-                                    self.logger.warning(traceback.format_exc())
+                                    self.logger.warning("Unexpected running filter on: %s:", infile, exc_info=True)
                                     self.logger.warning("-" * 60)
 
+    # Run in executor
+    def scan_app_dir(self) -> AppDirScan:
+        """Walks the apps directory once, recording the modified time of each file along the way.
+
+        Directories in ``exclude_dirs`` or with a ``.`` in their name are pruned, and hidden files are skipped. The
+        directories are walked depth first in the same order as :func:`os.walk`, but using :func:`os.scandir` so the
+        paths and stats come straight from the directory entries.
+        """
+        # List the directories one level at a time, which can be spread over the scan executor if there is one
+        listings: Dict[str, Tuple[List[Tuple[str, str, float]], List[str], List[str]]] = {}
+        pending = [self.AD.app_dir]
+        while pending:
+            if self.scan_executor is None:
+                results = map(self._scan_dir, pending)
+            else:
+                results = self.scan_executor.map(self._scan_dir, pending)
+
+            next_pending = []
+            for root, listing in zip(pending, results):
+                listings[root] = listing
+                next_pending.extend(listing[1])
+            pending = next_pending
+
+        # Put the listings back together depth first
+        scan = AppDirScan()
+        pending = [self.AD.app_dir]
+        while pending:
+            root = pending.pop()
+            files, subdirs, unreadable = listings[root]
+            scan.dirs.append(root)
+            for ext, path, modified in files:
+                scan.files.setdefault(ext, {})[path] = modified
+            scan.unreadable.update(unreadable)
+            pending.extend(reversed(subdirs))
+        return scan
+
+    def _scan_dir(self, root: str) -> Tuple[List[Tuple[str, str, float]], List[str], List[str]]:
+        """Lists a single directory, also checking that the Python files in it can be read when they'll be imported
+        from the scan.
+
+        Returns:
+            Tuple of the ``(extension, path, modified time)`` of each file, the subdirectories to walk next, and the
+            Python files that can't be read
+        """
+        files = []
+        subdirs = []
+        unreadable = []
+        check_py = self.AD.import_method == "normal"
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    name = entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if name not in self.AD.exclude_dirs and "." not in name:
+                                subdirs.append(entry.path)
+                        elif name[0] != "." and entry.is_file():
+                            ext = os.path.splitext(name)[1]
+                            files.append((ext, entry.path, entry.stat().st_mtime))
+                            if check_py and ext == ".py" and not os.access(entry.path, os.R_OK):
+                                unreadable.append(entry.path)
+                    except OSError:
+                        # Entry was removed while scanning
+                        continue
+        except OSError as err:
+            self.logger.warning("Unable to read directory %s: %s - skipping", root, err)
+        return files, subdirs, unreadable
+
     @staticmethod
-    def check_file(file: str):
-        with open(file, "r"):
-            pass
+    def find_unreadable_files(files: Iterable[Union[str, Path]]) -> Set[Union[str, Path]]:
+        """Checks a batch of files with :func:`os.access`, returning the ones that can't be read"""
+        return {file for file in files if not os.access(file, os.R_OK)}
 
     def add_to_import_path(self, path: Union[str, Path]):
         path = str(path)
@@ -1028,20 +1312,26 @@ class AppManagement:
             # Lets add some profiling
             pr = None
             if self.AD.check_app_updates_profile is True:
+                # Only needed for diagnostics, so not imported unless profiling is turned on
+                import cProfile
+
                 pr = cProfile.Profile()
                 pr.enable()
 
+            # Walk the app directory once for all the checks below
+            scan = await utils.run_in_executor(self, self.scan_app_dir)
+
             # Process filters
-            await utils.run_in_executor(self, self.process_filters)
+            await utils.run_in_executor(self, self.process_filters, scan)
 
             if mode == UpdateMode.INIT:
                 await self._init_update_mode()
 
             modules: List[ModuleLoad] = []
-            await self._refresh_monitored_files(modules)
+            await self._refresh_monitored_files(modules, scan)
 
             # Refresh app config
-            apps = await self.check_config()
+            apps = await self.check_config(scan=scan)
 
             await self._check_for_deleted_modules(mode, apps)
 
@@ -1058,14 +1348,17 @@ class AppManagement:
 
             await self._load_apps(mode, apps, apps_terminated)
 
-            if self.AD.check_app_updates_profile is True:
+            if pr is not None:
+                import io
+                import pstats
+
                 pr.disable()
 
-            s = io.StringIO()
-            sortby = "cumulative"
-            ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
-            ps.print_stats()
-            self.check_app_updates_profile_stats = s.getvalue()
+                s = io.StringIO()
+                sortby = "cumulative"
+                ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
+                ps.print_stats()
+                self.check_app_updates_profile_stats = s.getvalue()
 
             self.apps_initialized = True
 
@@ -1112,7 +1405,7 @@ class AppManagement:
         module_path = Path(module_obj.__file__)
         return module_path
 
-    async def _refresh_monitored_files(self, modules: List[ModuleLoad]):
+    async def _refresh_monitored_files(self, modules: List[ModuleLoad], scan: AppDirScan):
         """Refreshes the modified times of the monitored files. Part of self.check_app_updates sequence
 
         - Refreshes attributes
@@ -1120,49 +1413,38 @@ class AppManagement:
             - self.module_dirs
         """
         if self.AD.import_method == "normal":
-            found_files: List[str] = []
-            for root, subdirs, files in await utils.run_in_executor(self, os.walk, self.AD.app_dir, topdown=True):
-                # Prune dir list
-                subdirs[:] = [d for d in subdirs if d not in self.AD.exclude_dirs and "." not in d]
-
-                if root[-11:] != "__pycache__" and root[0] != ".":
-                    if root not in self.module_dirs:
-                        self.logger.info("Adding %s to module import path", root)
-                        sys.path.insert(0, root)
-                        self.module_dirs.append(root)
-
-                for file in files:
-                    if file[-3:] == ".py" and file[0] != ".":
-                        found_files.append(os.path.join(root, file))
-
-            for file in found_files:
-                if file == os.path.join(self.AD.app_dir, "__init__.py"):
+            for root in scan.dirs:
+                if root not in self.module_dirs:
+                    self.logger.info("Adding %s to module import path", root)
+                    sys.path.insert(0, root)
+                    self.module_dirs.append(root)
+
+            top_init = os.path.join(self.AD.app_dir, "__init__.py")
+            for file, modified in scan.files.get(".py", {}).items():
+                if file == top_init:
                     continue
-                try:
-                    # check we can actually open the file
-                    await utils.run_in_executor(self, self.check_file, file)
 
-                    modified = await utils.run_in_executor(self, os.path.getmtime, file)
+                # the scan checked we can actually read the file
+                if file in scan.unreadable:
+                    self.logger.warning("Unable to read app %s: %s - skipping", file, os.strerror(errno.EACCES))
+                    continue
 
-                    if file in self.monitored_files:
-                        if self.monitored_files[file] < modified:
-                            modules.append(ModuleLoad(path=file, reload=True))
-                            self.monitored_files[file] = modified
-                    else:
-                        self.logger.debug("Found module %s", file)
-                        modules.append(ModuleLoad(path=file, reload=False))
+                if file in self.monitored_files:
+                    if self.monitored_files[file] < modified:
+                        modules.append(ModuleLoad(path=file, reload=True))
                         self.monitored_files[file] = modified
-                except IOError as err:
-                    self.logger.warning("Unable to read app %s: %s - skipping", file, err)
+                else:
+                    self.logger.debug("Found module %s", file)
+                    modules.append(ModuleLoad(path=file, reload=False))
+                    self.monitored_files[file] = modified
 
         elif self.AD.import_method == "expert":
             found_files: List[Path] = await utils.run_in_executor(self, self.get_python_files)
+            # check we can actually read the files, all in one go
+            unreadable = await utils.run_in_executor(self, self.find_unreadable_files, found_files)
             for file in found_files:
-                # check we can actually open the file
-                try:
-                    await utils.run_in_executor(self, self.check_file, file)
-                except IOError as err:
-                    self.logger.warning("Unable to read app %s: %s - skipping", file, err)
+                if file in unreadable:
+                    self.logger.warning("Unable to read app %s: %s - skipping", file, os.strerror(errno.EACCES))
 
                 # file was readable during the check
                 else:
@@ -1223,30 +1505,28 @@ class AppManagement:
                 if module.reload:
                     apps.mark_app_for_termination(app)
 
-            for gm in self.get_global_modules():
-                if gm == self.get_module_from_path(module.name):
-                    for app in self.apps_per_global_module(gm):
-                        apps.mark_app_for_initialization(app)
-                        if module.reload:
-                            apps.mark_app_for_termination(app)
+            gm = self.get_module_from_path(module.name)
+            if gm in self._global_modules:
+                for app in self.apps_per_global_module(gm):
+                    apps.mark_app_for_initialization(app)
+                    if module.reload:
+                        apps.mark_app_for_termination(app)
 
     async def _restart_plugin(self, plugin, apps: AppActions):
         if plugin is not None:
             self.logger.info("Processing restart for %s", plugin)
             # This is a restart of one of the plugins so check which apps need to be restarted
+            non_apps = self.non_apps
+            app_plugins = self._app_plugins
             for app in self.app_config:
                 reload = False
-                if app in self.non_apps:
+                if app in non_apps:
                     continue
-                if "plugin" in self.app_config[app]:
-                    for this_plugin in utils.single_or_list(self.app_config[app]["plugin"]):
-                        if this_plugin == plugin:
-                            # We got a match so do the reload
-                            reload = True
-                            break
-                        elif plugin == "__ALL__":
-                            reload = True
-                            break
+                app_plugin = app_plugins.get(app)
+                if app_plugin is not None:
+                    if plugin == "__ALL__" or plugin in app_plugin:
+                        # We got a match so do the reload
+                        reload = True
                 else:
                     # No plugin dependency specified, reload to error on the side of caution
                     reload = True
@@ -1262,7 +1542,7 @@ class AppManagement:
             prio_apps = self.get_app_deps_and_prios(apps.term, mode)
 
             # Mark dependant global modules for reload
-            for app_name in sorted(prio_apps, key=prio_apps.get):
+            for app_name, _ in sorted(prio_apps.items(), key=itemgetter(1)):
                 app_path = self.get_path_from_app(app_name)
 
                 # If it's already in the list, set it to reload
@@ -1277,7 +1557,7 @@ class AppManagement:
                         modules.append(ModuleLoad(path=app_path, reload=True))
 
             # Terminate Apps
-            for app in sorted(prio_apps, key=prio_apps.get, reverse=True):
+            for app, _ in sorted(prio_apps.items(), key=itemgetter(1), reverse=True):
                 executed = await self.stop_app(app)
                 apps_terminated[app] = executed
 
@@ -1290,31 +1570,29 @@ class AppManagement:
                 await utils.run_in_executor(self, self.read_app, mod)
             except Exception:
                 self.error.warning("-" * 60)
-                self.error.warning("Unexpected error loading module: %s:", mod.name)
-                self.error.warning("-" * 60)
-                self.error.warning(traceback.format_exc())
+                self.error.warning("Unexpected error loading module: %s:", mod.name, exc_info=True)
                 self.error.warning("-" * 60)
                 if self.AD.logging.separate_error_log() is True:
                     self.logger.warning("Unexpected error loading module: %s:", mod.name)
 
                 self.logger.warning("Removing associated apps:")
                 module = self.get_module_from_path(mod.name)
-                for app in self.app_config:
-                    if "module" in self.app_config[app] and self.app_config[app]["module"] == module:
-                        if apps.init and app in apps.init:
-                            del apps.init[app]
-                            self.logger.warning("%s", app)
-                            await self.set_state(app, state="compile_error")
+                for app in self.apps_per_module(module):
+                    if apps.init and app in apps.init:
+                        del apps.init[app]
+                        self.logger.warning("%s", app)
+                        await self.set_state(app, state="compile_error")
 
     async def _load_apps(self, mode: UpdateMode, apps: AppActions, apps_terminated: Dict[str, bool]):
         """Loads apps from imported modules/packages. Part of self.check_app_updates sequence"""
         if apps is not None and apps.init:
             self.logger.info(f"{len(apps.init)} apps to initialize")
             prio_apps = self.get_app_deps_and_prios(apps.init, mode)
+            load_order = [app for app, _ in sorted(prio_apps.items(), key=itemgetter(1))]
 
             # Load Apps
 
-            for app in sorted(prio_apps, key=prio_apps.get):
+            for app in load_order:
                 try:
                     if "disable" in self.app_config[app] and self.app_config[app]["disable"] is True:
                         self.logger.info("%s is disabled", app)
@@ -1333,9 +1611,7 @@ class AppManagement:
                 except Exception:
                     error_logger = logging.getLogger("Error.{}".format(app))
                     error_logger.warning("-" * 60)
-                    error_logger.warning("Unexpected error initializing app: %s:", app)
-                    error_logger.warning("-" * 60)
-                    error_logger.warning(traceback.format_exc())
+                    error_logger.warning("Unexpected error initializing app: %s:", app, exc_info=True)
                     error_logger.warning("-" * 60)
                     if self.AD.logging.separate_error_log() is True:
                         self.logger.warning(
@@ -1347,7 +1623,7 @@ class AppManagement:
 
             # Call initialize() for apps
 
-            for app in sorted(prio_apps, key=prio_apps.get):
+            for app in load_order:
                 if "disable" in self.app_config[app] and self.app_config[app]["disable"] is True:
                     pass
                 elif "global" in self.app_config[app] and self.app_config[app]["global"] is True:
@@ -1370,45 +1646,28 @@ class AppManagement:
             _type_: _description_
         """
         # Build a list of modules and their dependencies
-        deplist = []
-        for app_name in applist:
-            if app_name not in deplist:
-                deplist.append(app_name)
-            self.get_dependent_apps(app_name, deplist)
-
-        # Need to give the topological sort a full list of apps or it will fail
-        full_list = list(self.app_config.keys())
-
-        deps = []
-
-        for app_name in full_list:
-            dependees = []
-            for dep in self.get_app_dependencies(app_name):
-                if dep in self.app_config:
-                    dependees.append(dep)
-                else:
-                    self.logger.warning("Unable to find app %s in dependencies for %s", dep, app_name)
-                    self.logger.warning("Ignoring app %s", app_name)
-            deps.append((app_name, dependees))
+        deplist = self.affected_apps(applist)
+
+        for app_name, missing in self._missing_deps.items():
+            for dep in missing:
+                self.logger.warning("Unable to find app %s in dependencies for %s", dep, app_name)
+                self.logger.warning("Ignoring app %s", app_name)
 
         prio_apps = {}
         prio = float(50.1)
-        try:
-            for app_name in self.topological_sort(deps):
-                if (
-                    "dependencies" in self.app_config[app_name]
-                    or app_name in self.global_module_dependencies
-                    or self.app_has_dependents(app_name)
-                ):
-                    prio_apps[app_name] = prio
-                    prio += float(0.0001)
+        for app_name in self.get_dependency_order():
+            if (
+                "dependencies" in self.app_config[app_name]
+                or app_name in self.global_module_dependencies
+                or self.app_has_dependents(app_name)
+            ):
+                prio_apps[app_name] = prio
+                prio += float(0.0001)
+            else:
+                if mode == UpdateMode.INIT and "priority" in self.app_config[app_name]:
+                    prio_apps[app_name] = float(self.app_config[app_name]["priority"])
                 else:
-                    if mode == UpdateMode.INIT and "priority" in self.app_config[app_name]:
-                        prio_apps[app_name] = float(self.app_config[app_name]["priority"])
-                    else:
-                        prio_apps[app_name] = float(50)
-        except ValueError:
-            pass
+                    prio_apps[app_name] = float(50)
 
         # now we remove the ones we aren't interested in
 
@@ -1419,84 +1678,105 @@ class AppManagement:
 
         return final_apps
 
+    def get_dependency_order(self) -> List[str]:
+        """Sorts all the apps by their dependencies, reusing the last result until the dependencies change.
+
+        If there's a cycle, only the apps ahead of it are included, and the warnings are logged once per change.
+        """
+        if self._dependency_order is None:
+            # Need to give the topological sort a full list of apps or it will fail
+            no_deps = frozenset()
+            source = [(app_name, self._deps_frozen.get(app_name, no_deps)) for app_name in self.app_config]
+            order = []
+            try:
+                for app_name in self.topological_sort(source):
+                    order.append(app_name)
+            except ValueError:
+                pass
+            self._dependency_order = order
+        return self._dependency_order
+
     def app_has_dependents(self, name):
-        for app in self.app_config:
-            for dep in self.get_app_dependencies(app):
-                if dep == name:
-                    return True
-        return False
-
-    def get_dependent_apps(self, dependee, deps):
-        for app in self.app_config:
-            for dep in self.get_app_dependencies(app):
-                # print("app= {} dep = {}, dependee = {} deps = {}".format(app, dep, dependee, deps))
-                if dep == dependee and app not in deps:
-                    deps.append(app)
-                    new_deps = self.get_dependent_apps(app, deps)
-                    if new_deps is not None:
-                        deps.append(new_deps)
+        return name in self._dependents
+
+    def affected_apps(self, apps: Iterable[str]) -> Set[str]:
+        """Finds the given apps along with every app that depends on any of them, in a single walk.
+
+        Dependents shared between several of the apps are only visited once.
+        """
+        seen = set(apps)
+        queue = deque(seen)
+        while queue:
+            for app in self._dependents.get(queue.popleft(), ()):
+                if app not in seen:
+                    seen.add(app)
+                    queue.append(app)
+        return seen
 
     def topological_sort(self, source):
-        pending = [(name, set(deps)) for name, deps in source]  # copy deps so we can modify set in-place
-        emitted = []
-        while pending:
-            next_pending = []
-            next_emitted = []
-            for entry in pending:
-                name, deps = entry
-                deps.difference_update(emitted)  # remove deps we emitted last pass
-                if deps:  # still has deps? recheck during next pass
-                    next_pending.append(entry)
-                else:  # no more deps? time to emit
-                    yield name
-                    emitted.append(name)  # <-- not required, but helps preserve original ordering
-                    next_emitted.append(name)  # remember what we emitted for difference_update() in next pass
-            if not next_emitted:
-                # all entries have unmet deps, we have cyclic redundancies
-                # since we already know all deps are correct
-                self.logger.warning("Cyclic or missing app dependencies detected")
-                for pend in next_pending:
-                    deps = ""
-                    for dep in pend[1]:
-                        deps += "{} ".format(dep)
-                    self.logger.warning("%s depends on %s", pend[0], deps)
-                raise ValueError("cyclic dependency detected")
-            pending = next_pending
-            emitted = next_emitted
+        """Yields the names in ``source`` so that each one comes after all of its dependencies.
+
+        Uses Kahn's algorithm, with each wave taken in ``source`` order. An entry whose last dependency is emitted
+        later in the same wave waits for the next wave, so the order is the same as repeatedly sweeping ``source``.
+
+        Args:
+            source: ``(name, dependencies)`` pairs, with the dependencies as a set or frozenset
+
+        Raises:
+            ValueError: if some of the entries can never be emitted
+        """
+        names = []
+        dep_sets = []
+        indegree = []
+        waiting = {}  # dependency name -> indexes of the entries that need it
+        ready = []
+        for idx, (name, deps) in enumerate(source):
+            names.append(name)
+            dep_sets.append(deps)
+            indegree.append(len(deps))
+            for dep in deps:
+                waiting.setdefault(dep, []).append(idx)
+            if not deps:
+                ready.append(idx)
+
+        emitted = 0
+        while ready:
+            wave = ready
+            heapq.heapify(wave)
+            ready = []
+            while wave:
+                idx = heapq.heappop(wave)
+                yield names[idx]
+                emitted += 1
+                for entry in waiting.get(names[idx], ()):
+                    indegree[entry] -= 1
+                    if indegree[entry] == 0:
+                        if entry > idx:  # still ahead in this wave
+                            heapq.heappush(wave, entry)
+                        else:
+                            ready.append(entry)
+
+        if emitted < len(names):
+            # all remaining entries have unmet deps, we have cyclic redundancies
+            # since we already know all deps are correct
+            emitted_names = {names[idx] for idx, count in enumerate(indegree) if count == 0}
+            next_pending = [(names[idx], dep_sets[idx] - emitted_names) for idx, count in enumerate(indegree) if count]
+            self.logger.warning("Cyclic or missing app dependencies detected")
+            for pend in next_pending:
+                self.logger.warning("%s depends on %s", pend[0], " ".join(sorted(map(str, pend[1]))))
+            raise ValueError("cyclic dependency detected")
 
     def apps_per_module(self, module_name: str):
         """Finds which apps came from a given module name"""
-        return [
-            app_name
-            for app_name, app_cfg in self.app_config.items()
-            if app_name not in self.non_apps and app_cfg["module"].split(".")[0] == module_name
-        ]
+        return list(self._apps_by_module.get(module_name, ()))
 
     def apps_per_global_module(self, module):
-        apps = []
-        for app in self.app_config:
-            if "global_dependencies" in self.app_config[app]:
-                for gm in utils.single_or_list(self.app_config[app]["global_dependencies"]):
-                    if gm == module:
-                        apps.append(app)
-
-            if "dependencies" in self.app_config[app]:
-                for gm in utils.single_or_list(self.app_config[app]["dependencies"]):
-                    if gm == module:
-                        apps.append(app)
-
-        return apps
+        return list(self._apps_by_global_module.get(module, ()))
 
     def get_app_dependencies(self, app):
-        deps = []
-        if "dependencies" in self.app_config[app]:
-            for dep in utils.single_or_list(self.app_config[app]["dependencies"]):
-                deps.append(dep)
-
+        deps = list(self._norm_deps.get(app, ()))
         if app in self.global_module_dependencies:
-            for dep in self.global_module_dependencies[app]:
-                deps.append(dep)
-
+            deps.extend(self.global_module_dependencies[app])
         return deps
 
     def create_app(self, app=None, **kwargs):
@@ -1542,7 +1822,7 @@ class AppManagement:
             self.logger.info("Creating app using filename %s", app_file)
 
         else:
-            if app_file[-5:] != self.ext:
+            if not app_file.endswith(self.ext):
                 app_file = f"{app_file}{self.ext}"
 
             app_file = os.path.join(app_directory, app_file)
@@ -1581,9 +1861,7 @@ class AppManagement:
 
         except Exception:
             self.error.warning("-" * 60)
-            self.error.warning("Unexpected error while writing to file: %s", app_file)
-            self.error.warning("-" * 60)
-            self.error.warning(traceback.format_exc())
+            self.error.warning("Unexpected error while writing to file: %s", app_file, exc_info=True)
             self.error.warning("-" * 60)
             executed = False
 
@@ -1623,9 +1901,7 @@ class AppManagement:
 
         except Exception:
             self.error.warning("-" * 60)
-            self.error.warning("Unexpected error while writing to file: %s", app_file)
-            self.error.warning("-" * 60)
-            self.error.warning(traceback.format_exc())
+            self.error.warning("Unexpected error while writing to file: %s", app_file, exc_info=True)
             self.error.warning("-" * 60)
             executed = False
 
@@ -1667,9 +1943,7 @@ class AppManagement:
 
         except Exception:
             self.error.warning("-" * 60)
-            self.error.warning("Unexpected error while writing to file: %s", app_file)
-            self.error.warning("-" * 60)
-            self.error.warning(traceback.format_exc())
+            self.error.warning("Unexpected error while writing to file: %s", app_file, exc_info=True)
             self.error.warning("-" * 60)
 
         return result
@@ -1697,6 +1971,8 @@ class AppManagement:
 
                     if module_name not in self.global_module_dependencies[name]:
                         self.global_module_dependencies[name].append(module_name)
+                        if name in self.app_config:
+                            self._index_app_dependencies(name)
                 else:
                     self.logger.warning(
                         "Module %s not a global_modules in register_module_dependency() for %s",
@@ -1710,9 +1986,9 @@ class AppManagement:
             for gm in utils.single_or_list(self.app_config["global_modules"]):
                 gms.append(gm)
 
-        for app in self.app_config:
-            if "global" in self.app_config[app] and self.app_config[app]["global"] is True:
-                gms.append(self.app_config[app]["module"])
+        for app, app_cfg in self.app_config.items():
+            if app not in self.non_apps and app_cfg.get("global") is True:
+                gms.append(app_cfg["module"])
 
         return gms
 
@@ -188,6 +188,9 @@ class AppDaemon:
         self.threadpool_workers = 10
         utils.process_arg(self, "threadpool_workers", kwargs, int=True)
 
+        self.app_dir_scan_workers = 0
+        utils.process_arg(self, "app_dir_scan_workers", kwargs, int=True)
+
         self.endtime = None
         utils.process_arg(self, "endtime", kwargs)
 
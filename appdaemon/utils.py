@@ -20,7 +20,7 @@ from collections.abc import Iterable
 from datetime import timedelta
 from functools import wraps
 from types import ModuleType
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import dateutil.parser
 import tomli
@@ -29,6 +29,12 @@ import yaml
 
 from appdaemon.version import __version__  # noqa: F401
 
+# Prefer the libyaml backed loader when PyYAML was built against it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # Comment
 
 if platform.system() != "Windows":
@@ -597,18 +603,24 @@ def write_toml_config(path, **kwargs):
         tomli_w.dump(kwargs, stream)
 
 
-def read_config_file(path) -> Dict[str, Dict]:
-    """Reads a single YAML or TOML file."""
+def read_config_file(path, included: Optional[List[Tuple[str, float]]] = None) -> Dict[str, Dict]:
+    """Reads a single YAML or TOML file.
+
+    Args:
+        path: File to read
+        included (list, optional): If given, the path and modified time of every other file the config was read
+            from, through ``!include`` or its own ``secrets`` file, are appended to it
+    """
     extension = os.path.splitext(path)[1]
     if extension == ".yaml":
-        return read_yaml_config(path)
+        return read_yaml_config(path, included)
     elif extension == ".toml":
-        return read_toml_config(path)
+        return read_toml_config(path, included)
     else:
         raise ValueError(f"ERROR: unknown file extension: {extension}")
 
 
-def read_toml_config(path):
+def read_toml_config(path, included: Optional[List[Tuple[str, float]]] = None):
     with open(path, "rb") as f:
         config = tomli.load(f)
 
@@ -620,6 +632,8 @@ def read_toml_config(path):
         secrets_file = os.path.join(os.path.dirname(path), "secrets.toml")
 
     try:
+        if included is not None and "secrets" in config:
+            included.append((secrets_file, os.path.getmtime(secrets_file)))
         with open(secrets_file, "rb") as f:
             secrets = tomli.load(f)
     except FileNotFoundError:
@@ -706,38 +720,54 @@ def _env_var_yaml(loader, node):
 
 def _include_yaml(loader, node):
     filename = node.value
-    if not os.path.isfile(filename) or filename.split(".")[-1] != "yaml":
+    if not os.path.isfile(filename) or not filename.endswith(".yaml"):
         raise ValueError("{} is not a valid yaml file".format(filename))
 
-    with open(filename, "r") as f:
-        return yaml.load(f, Loader=yaml.SafeLoader)
+    included = getattr(loader, "included", None)
+    if included is not None:
+        included.append((filename, os.path.getmtime(filename)))
 
+    with open(filename, "rb") as f:
+        return _load_yaml(f.read(), type(loader), included)
 
-def read_yaml_config(config_file_yaml) -> Dict[str, Dict]:
-    #
-    # First locate secrets file
-    #
-    #    try:
-    #
-    # Read config file using include directory
-    #
 
-    yaml.add_constructor("!include", _include_yaml, Loader=yaml.SafeLoader)
+def _load_yaml(contents, loader_class, included: Optional[List[Tuple[str, float]]]):
+    """Same as :func:`yaml.load`, but ``!include`` adds the files it reads to ``included``"""
+    loader = loader_class(contents)
+    loader.included = included
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
 
-    #
-    # Read config file using environment variables
-    #
 
-    yaml.add_constructor("!env_var", _env_var_yaml, Loader=yaml.SafeLoader)
+class _PreSecretsLoader(_YamlLoader):
+    """Loader for the first pass over a config file, before the secrets are known."""
 
+
+class _ConfigLoader(_YamlLoader):
+    """Loader for the final pass over a config file, resolving ``!secret`` tags."""
+
+
+#
+# Register the tag constructors once, rather than on every read
+#
+for _loader in (_PreSecretsLoader, _ConfigLoader):
+    _loader.add_constructor("!include", _include_yaml)
+    _loader.add_constructor("!env_var", _env_var_yaml)
+_PreSecretsLoader.add_constructor("!secret", _dummy_secret)
+_ConfigLoader.add_constructor("!secret", _secret_yaml)
+
+
+def read_yaml_config(config_file_yaml, included: Optional[List[Tuple[str, float]]] = None) -> Dict[str, Dict]:
     #
     # Initially load file to see if secret directive is present
     #
-    yaml.add_constructor("!secret", _dummy_secret, Loader=yaml.SafeLoader)
-    with open(config_file_yaml, "r") as yamlfd:
+    with open(config_file_yaml, "rb") as yamlfd:
         config_file_contents = yamlfd.read()
 
-    config = yaml.load(config_file_contents, Loader=yaml.SafeLoader)
+    first_included = []
+    config = _load_yaml(config_file_contents, _PreSecretsLoader, first_included)
 
     if "secrets" in config:
         secrets_file = config["secrets"]
@@ -748,11 +778,13 @@ def read_yaml_config(config_file_yaml) -> Dict[str, Dict]:
     # Read Secrets
     #
     if os.path.isfile(secrets_file):
-        with open(secrets_file, "r") as yamlfd:
+        if included is not None and "secrets" in config:
+            included.append((secrets_file, os.path.getmtime(secrets_file)))
+        with open(secrets_file, "rb") as yamlfd:
             secrets_file_contents = yamlfd.read()
 
         global secrets
-        secrets = yaml.load(secrets_file_contents, Loader=yaml.SafeLoader)
+        secrets = yaml.load(secrets_file_contents, Loader=_PreSecretsLoader)
 
     else:
         if "secrets" in config:
@@ -763,15 +795,17 @@ def read_yaml_config(config_file_yaml) -> Dict[str, Dict]:
             return None
 
     #
-    # Read config file again, this time with secrets
+    # The first pass is only wrong where a secret was stubbed out, possibly in an included file
     #
+    if b"!secret" not in config_file_contents and b"!include" not in config_file_contents:
+        if included is not None:
+            included.extend(first_included)
+        return config
 
-    yaml.add_constructor("!secret", _secret_yaml, Loader=yaml.SafeLoader)
-
-    with open(config_file_yaml, "r") as yamlfd:
-        config_file_contents = yamlfd.read()
-
-    config = yaml.load(config_file_contents, Loader=yaml.SafeLoader)
+    #
+    # Parse the same contents again, this time with secrets
+    #
+    config = _load_yaml(config_file_contents, _ConfigLoader, included)
 
     return config
 
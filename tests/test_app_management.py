@@ -0,0 +1,476 @@
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import appdaemon.utils as utils
+from appdaemon.app_management import AppManagement
+
+
+def write(path, text, bump=0):
+    with open(path, "w") as f:
+        f.write(text)
+    if bump:
+        # Makes sure the change is seen, even on filesystems with a coarse modified time
+        t = time.time() + bump
+        os.utime(path, (t, t))
+
+
+@pytest.fixture
+def app_dir(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def executor():
+    executor = concurrent.futures.ThreadPoolExecutor(2)
+    yield executor
+    executor.shutdown()
+
+
+def make_app_management(loop, executor, app_dir) -> AppManagement:
+    ad = MagicMock()
+    ad.loop = loop
+    ad.executor = executor
+    ad.app_dir = app_dir
+    ad.exclude_dirs = ["__pycache__"]
+    ad.import_method = "normal"
+    ad.app_dir_scan_workers = 0
+    ad.invalid_config_warnings = False
+    ad.http = None
+    ad.logging.get_child.return_value = logging.getLogger("AppDaemon._app_management")
+    ad.logging.get_error.return_value = logging.getLogger("Error")
+    ad.logging.get_diag.return_value = logging.getLogger("Diag")
+    ad.state = MagicMock(set_state=AsyncMock(), add_entity=AsyncMock(), remove_entity=AsyncMock())
+    ad.events = MagicMock(process_event=AsyncMock())
+    ad.sequences = MagicMock(add_sequences=AsyncMock(), remove_sequences=AsyncMock())
+    ad.threading = MagicMock(calculate_pin_threads=AsyncMock(), add_thread=AsyncMock(), auto_pin=False)
+    ad.callbacks = MagicMock(clear_callbacks=AsyncMock())
+    ad.sched = MagicMock(terminate_app=AsyncMock())
+    return AppManagement(ad, False)
+
+
+def run_checks(app_dir, executor, *steps):
+    """Runs check_config once initially and then once after each step, returning the results of those checks"""
+
+    async def main():
+        am = make_app_management(asyncio.get_running_loop(), executor, app_dir)
+        results = [await am.check_config(silent=True, add_threads=False)]
+        for step in steps:
+            step()
+            results.append(await am.check_config(silent=True, add_threads=False))
+        return am, results
+
+    return asyncio.run(main())
+
+
+def test_config_changed_through_include(app_dir, executor):
+    include = os.path.join(app_dir, "inc_args.yaml")
+    write(include, "x: 1\n")
+    write(os.path.join(app_dir, "apps.yaml"), f"a1:\n  module: a\n  class: A\n  args: !include {include}\n")
+
+    am, (_, actions) = run_checks(app_dir, executor, lambda: write(include, "x: 2\n", bump=5))
+
+    assert am.app_config["a1"]["args"] == {"x": 2}
+    assert actions.init == {"a1": 1}
+
+
+def test_config_changed_through_secrets_file(app_dir, executor):
+    secrets = os.path.join(app_dir, "my_secrets.yaml")
+    write(secrets, "token: old\n")
+    write(
+        os.path.join(app_dir, "apps.yaml"),
+        f"secrets: {secrets}\na1:\n  module: a\n  class: A\n  token: !secret token\n",
+    )
+
+    am, (_, actions) = run_checks(app_dir, executor, lambda: write(secrets, "token: new\n", bump=5))
+
+    assert am.app_config["a1"]["token"] == "new"
+    assert actions.init == {"a1": 1}
+
+
+def test_unchanged_config_file_is_cached(app_dir, executor):
+    apps = os.path.join(app_dir, "apps.yaml")
+    write(apps, "a1:\n  module: a\n  class: A\n")
+    other = os.path.join(app_dir, "other.yaml")
+    write(other, "a2:\n  module: b\n  class: B\n")
+
+    am, (_, actions) = run_checks(app_dir, executor, lambda: write(other, "a2:\n  module: b\n  class: C\n", bump=5))
+
+    assert set(am.config_file_cache) == {apps, other}
+    assert actions.init == {"a2": 1}
+
+
+def test_config_with_nested_include_outside_app_dir(app_dir, executor, tmp_path_factory):
+    include_dir = tmp_path_factory.mktemp("includes")
+    inner = str(include_dir / "inner.yaml")
+    outer = str(include_dir / "outer.yaml")
+    write(inner, "x: 1\n")
+    write(outer, f"inner: !include {inner}\n")
+    apps = os.path.join(app_dir, "apps.yaml")
+    # mentioning !include in a comment doesn't matter either way
+    write(apps, f"# !include\na1:\n  module: a\n  class: A\n  args: !include {outer}\n")
+    other = os.path.join(app_dir, "other.yaml")
+    write(other, "a2:\n  module: b\n  class: B\n")
+
+    am, (_, unrelated, changed) = run_checks(
+        app_dir,
+        executor,
+        lambda: write(other, "a2:\n  module: b\n  class: C\n", bump=5),
+        # config files are only read again once something in the apps directory changes
+        lambda: (write(inner, "x: 2\n", bump=10), write(other, "a2:\n  module: b\n  class: B\n", bump=10)),
+    )
+
+    # cached along with both included files, so an unrelated change doesn't touch it
+    assert set(am.config_file_cache[apps][3]) == {inner, outer}
+    assert unrelated.init == {"a2": 1}
+    assert changed.init == {"a1": 1, "a2": 1}
+    assert am.app_config["a1"]["args"] == {"inner": {"x": 2}}
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({1: "a"}, {"1": "a"}),
+        ({"x": 1}, {"x": "1"}),
+        ({"x": 1}, {"x": True}),
+        ({"x": [1, 2]}, {"x": (1, 2)}),
+        ({"x": datetime.date(2024, 1, 2)}, {"x": "datetime.date(2024, 1, 2)"}),
+        ({"x": datetime.date(2024, 1, 2)}, {"x": datetime.datetime(2024, 1, 2)}),
+    ],
+)
+def test_config_digest_keeps_types(old, new):
+    assert AppManagement.config_digest(old) != AppManagement.config_digest(new)
+
+
+def test_config_digest_ignores_key_order():
+    assert AppManagement.config_digest({"a": 1, "b": {"c": [1, 2]}}) == AppManagement.config_digest(
+        {"b": {"c": [1, 2]}, "a": 1}
+    )
+
+
+def test_config_digest_unknown_type():
+    assert AppManagement.config_digest({"x": object()}) is None
+
+
+def test_all_config_files_deleted(app_dir, executor):
+    apps = os.path.join(app_dir, "apps.yaml")
+    write(apps, "a1:\n  module: a\n  class: A\n")
+
+    am, (_, actions) = run_checks(app_dir, executor, lambda: os.remove(apps))
+
+    assert am.app_config == {}
+    am.AD.state.remove_entity.assert_awaited_once_with("admin", "app.a1")
+
+
+def sweep_sort(source):
+    """The original topological sort, which sweeps the pending entries once per pass, kept as a reference"""
+    pending = [(name, set(deps)) for name, deps in source]
+    emitted = []
+    while pending:
+        next_pending = []
+        next_emitted = []
+        for entry in pending:
+            name, deps = entry
+            deps.difference_update(emitted)
+            if deps:
+                next_pending.append(entry)
+            else:
+                yield name
+                emitted.append(name)
+                next_emitted.append(name)
+        if not next_emitted:
+            raise ValueError("cyclic dependency detected")
+        pending = next_pending
+        emitted = next_emitted
+
+
+def sort_order(sort, source):
+    order = []
+    try:
+        for name in sort(source):
+            order.append(name)
+    except ValueError:
+        order.append(ValueError)
+    return order
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        # b comes first in the source but depends on a, so it waits for the next wave even though a is emitted in this one
+        ([("b", {"a"}), ("a", set()), ("c", {"a"})], ["a", "c", "b"]),
+        (
+            [("d", {"b", "c"}), ("c", {"a"}), ("b", {"a"}), ("a", set()), ("e", set())],
+            ["a", "e", "c", "b", "d"],
+        ),
+        ([("a", set()), ("b", {"a"}), ("c", {"b"})], ["a", "b", "c"]),
+        ([("c", {"b"}), ("b", {"a"}), ("a", set())], ["a", "b", "c"]),
+        ([("a", set()), ("b", {"c"}), ("c", {"b", "a"}), ("d", set())], ["a", "d", ValueError]),
+        ([("a", {"missing"}), ("b", set())], ["b", ValueError]),
+    ],
+)
+def test_topological_sort_matches_sweep(app_dir, source, expected):
+    am = make_app_management(None, None, app_dir)
+    frozen = [(name, frozenset(deps)) for name, deps in source]
+
+    assert sort_order(sweep_sort, source) == expected
+    assert sort_order(am.topological_sort, frozen) == expected
+
+
+def test_topological_sort_cycle_warning(app_dir, caplog):
+    am = make_app_management(None, None, app_dir)
+    source = [("a", frozenset()), ("b", frozenset({"c"})), ("c", frozenset({"b", "a", "d"})), ("d", frozenset())]
+
+    with caplog.at_level(logging.WARNING, logger="AppDaemon._app_management"):
+        with pytest.raises(ValueError, match="cyclic dependency detected"):
+            list(am.topological_sort(source))
+
+    assert caplog.messages == [
+        "Cyclic or missing app dependencies detected",
+        "b depends on c",
+        "c depends on b",
+    ]
+
+
+@pytest.mark.parametrize("import_method", ["normal", "expert"])
+def test_unreadable_app_file_is_skipped(app_dir, executor, monkeypatch, caplog, import_method):
+    write(os.path.join(app_dir, "a.py"), "x = 1\n")
+    write(os.path.join(app_dir, "b.py"), "x = 1\n")
+    real_access = os.access
+    monkeypatch.setattr(os, "access", lambda path, mode: not str(path).endswith("a.py") and real_access(path, mode))
+
+    async def main():
+        am = make_app_management(asyncio.get_running_loop(), executor, app_dir)
+        am.AD.import_method = import_method
+        am.mod_pkg_map = {}
+        modules = []
+        await am._refresh_monitored_files(modules, await utils.run_in_executor(am, am.scan_app_dir))
+        return modules
+
+    modules = asyncio.run(main())
+
+    assert [os.path.basename(module.path) for module in modules] == ["b.py"]
+    assert f"Unable to read app {os.path.join(app_dir, 'a.py')}: Permission denied - skipping" in caplog.messages
+
+
+def make_tree(app_dir, outside):
+    """Builds a nested apps directory with every kind of entry that the scan has to prune or skip"""
+    files = [
+        "a.py",
+        "apps.yaml",
+        "t.tmpl",
+        "README",
+        ".hidden.py",
+        ".hidden.tmpl",
+        "sub/b.py",
+        "sub/more.yaml",
+        "sub/u.tmpl",
+        "sub/deep/c.py",
+        "sub/deep/deeper/d.py",
+        "zsub/e.py",
+        "excl/x.py",
+        ".git/y.py",
+        "pkg.v2/z.py",
+        "__pycache__/a.cpython-311.pyc",
+    ]
+    for file in files:
+        path = os.path.join(app_dir, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(path, "x = 1\n")
+
+    write(os.path.join(outside, "w.py"), "x = 1\n")
+    os.symlink(outside, os.path.join(app_dir, "linked_dir"))
+    os.symlink(os.path.join(app_dir, "a.py"), os.path.join(app_dir, "linked.py"))
+
+
+def walk_reference(app_dir, exclude_dirs):
+    """Scans the apps directory with os.walk, applying the same pruning rules as AppManagement.scan_app_dir"""
+    dirs = []
+    files = {}
+    for root, subdirs, names in os.walk(app_dir):
+        subdirs[:] = [d for d in subdirs if d not in exclude_dirs and "." not in d]
+        dirs.append(root)
+        for name in names:
+            if name[0] != ".":
+                path = os.path.join(root, name)
+                files.setdefault(os.path.splitext(name)[1], {})[path] = os.path.getmtime(path)
+    return dirs, files
+
+
+def scan(app_dir, workers=0):
+    am = make_app_management(None, None, app_dir)
+    am.AD.exclude_dirs = ["__pycache__", "excl"]
+    if workers:
+        am.scan_executor = concurrent.futures.ThreadPoolExecutor(workers)
+    try:
+        return am.scan_app_dir()
+    finally:
+        if am.scan_executor is not None:
+            am.scan_executor.shutdown()
+
+
+def test_scan_app_dir_matches_os_walk(app_dir, tmp_path_factory):
+    make_tree(app_dir, str(tmp_path_factory.mktemp("outside")))
+
+    result = scan(app_dir)
+
+    assert (result.dirs, result.files) == walk_reference(app_dir, ["__pycache__", "excl"])
+    rel = {ext: sorted(os.path.relpath(path, app_dir) for path in paths) for ext, paths in result.files.items()}
+    assert rel == {
+        ".py": ["a.py", "linked.py", "sub/b.py", "sub/deep/c.py", "sub/deep/deeper/d.py", "zsub/e.py"],
+        ".yaml": ["apps.yaml", "sub/more.yaml"],
+        ".tmpl": ["sub/u.tmpl", "t.tmpl"],
+        "": ["README"],
+    }
+    assert sorted(os.path.relpath(path, app_dir) for path in result.dirs) == [
+        ".",
+        "sub",
+        "sub/deep",
+        "sub/deep/deeper",
+        "zsub",
+    ]
+    assert result.unreadable == set()
+
+
+def test_process_filters(app_dir, monkeypatch, tmp_path_factory):
+    make_tree(app_dir, str(tmp_path_factory.mktemp("outside")))
+    commands = []
+    monkeypatch.setattr("appdaemon.app_management.subprocess.Popen", lambda cmd, shell: commands.append(cmd))
+    am = make_app_management(None, None, app_dir)
+    am.AD.exclude_dirs = ["__pycache__", "excl"]
+    am.AD.config = {
+        "filters": [
+            {"command_line": "cp $1 $2", "input_ext": "tmpl", "output_ext": "txt"},
+            {"command_line": "never $1", "input_ext": "", "output_ext": "txt"},
+        ]
+    }
+    t = os.path.join(app_dir, "t.tmpl")
+    u = os.path.join(app_dir, "sub", "u.tmpl")
+
+    am.process_filters(am.scan_app_dir())
+    assert sorted(commands) == sorted([f"cp {t} {t[:-4]}txt", f"cp {u} {u[:-4]}txt"])
+
+    commands.clear()
+    am.process_filters(am.scan_app_dir())
+    assert commands == []
+
+    write(t, "changed\n", bump=5)
+    am.process_filters(am.scan_app_dir())
+    assert commands == [f"cp {t} {t[:-4]}txt"]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_parallel_scan_matches_serial_scan(app_dir, tmp_path_factory, workers):
+    make_tree(app_dir, str(tmp_path_factory.mktemp("outside")))
+
+    assert scan(app_dir, workers) == scan(app_dir)
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_scan_skips_unreadable_dir(app_dir, tmp_path_factory, monkeypatch, caplog, workers):
+    make_tree(app_dir, str(tmp_path_factory.mktemp("outside")))
+    unreadable = os.path.join(app_dir, "sub", "deep")
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if path == unreadable:
+            raise PermissionError(13, "Permission denied", path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+
+    result = scan(app_dir, workers)
+
+    assert sorted(os.path.relpath(path, app_dir) for path in result.files[".py"]) == [
+        "a.py",
+        "linked.py",
+        "sub/b.py",
+        "zsub/e.py",
+    ]
+    assert sorted(os.path.relpath(path, app_dir) for path in result.dirs) == [".", "sub", "sub/deep", "zsub"]
+    assert result == scan(app_dir)
+    assert (
+        f"Unable to read directory {unreadable}: [Errno 13] Permission denied: '{unreadable}' - skipping"
+        in caplog.messages
+    )
+
+
+INDEXED_APPS = """
+foo:
+  module: foo
+  class: Foo
+foobar:
+  module: foobar
+  class: FooBar
+pkgapp:
+  module: pkg.sub
+  class: Pkg
+glob:
+  module: glob
+  global: true
+b:
+  module: b
+  class: B
+  dependencies: foo
+  global_dependencies: glob
+c:
+  module: c
+  class: C
+  dependencies: b
+d:
+  module: d
+  class: D
+  dependencies: [b, foo]
+e:
+  module: e
+  class: E
+  dependencies: [c, d]
+"""
+
+
+def test_app_indexes(app_dir, executor):
+    write(os.path.join(app_dir, "apps.yaml"), INDEXED_APPS)
+
+    am, _ = run_checks(app_dir, executor)
+
+    assert am.apps_per_module("foo") == ["foo"]
+    assert am.apps_per_module("foobar") == ["foobar"]
+    assert am.apps_per_module("pkg") == ["pkgapp"]
+    assert am.apps_per_module("pkg.sub") == []
+    assert am.get_app_from_file(os.path.join(app_dir, "foo.py")) == "foo"
+    assert am.get_app_from_file(os.path.join(app_dir, "foobar.py")) == "foobar"
+    assert am.get_app_from_file(os.path.join(app_dir, "fo.py")) is None
+
+    assert am.apps_per_global_module("glob") == ["b"]
+    assert am.apps_per_global_module("foo") == ["b", "d"]
+
+    assert [name for name in am.app_config if am.app_has_dependents(name)] == ["foo", "b", "c", "d"]
+    assert am.affected_apps(["foo"]) == {"foo", "b", "c", "d", "e"}
+    assert am.affected_apps(["c", "d"]) == {"c", "d", "e"}
+    assert am.affected_apps(["e", "foobar"]) == {"e", "foobar"}
+
+
+def test_register_module_dependency_updates_order(app_dir, executor):
+    write(os.path.join(app_dir, "apps.yaml"), INDEXED_APPS)
+
+    async def main():
+        am = make_app_management(asyncio.get_running_loop(), executor, app_dir)
+        await am.check_config(silent=True, add_threads=False)
+        before = list(am.get_dependency_order())
+        await am.register_module_dependency("foobar", "glob")
+        assert am._dependency_order is None
+        return am, before
+
+    am, before = asyncio.run(main())
+
+    assert before == ["foo", "foobar", "pkgapp", "glob", "b", "c", "d", "e"]
+    # glob comes after foobar in the config, so foobar now has to wait for the next wave
+    assert am.get_dependency_order() == ["foo", "pkgapp", "glob", "b", "c", "d", "e", "foobar"]
+    assert am.app_has_dependents("glob")
+    assert am.affected_apps(["glob"]) == {"glob", "foobar"}